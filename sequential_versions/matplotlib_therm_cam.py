@@ -6,14 +6,19 @@
 
 import configparser
 import logging
+import threading
 import time
+from collections import deque
 
 import adafruit_mlx90640
 import board
 import busio
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy import ndimage
+import cv2
+import matplotlib
+
+matplotlib.use("TkAgg")  # TkAgg blits via Tk_PhotoPutBlock and releases the GIL as of matplotlib 3.5
+import matplotlib.pyplot as plt  # pylint: disable=wrong-import-position
+import numpy as np  # pylint: disable=wrong-import-position
 
 profiling = False  # Flag to turn profiling on
 if profiling:
@@ -22,6 +27,9 @@ if profiling:
 
 # Manual Params
 DEBUG_MODE = False
+INTERPOLATION_METHOD = "cv2"  # Options: "cv2" (bicubic resize), "fft" (spectral zero-padding), "numba" (bilinear)
+if INTERPOLATION_METHOD == "numba":
+    from numba import njit, prange  # Optional dependency, only needed for this method
 
 # Set up Logger
 if DEBUG_MODE:
@@ -61,20 +69,130 @@ def c_to_f(temp: float):
     return (9.0 / 5.0) * temp + 32.0
 
 
+def update_clim(mappable, vmin: float, vmax: float):
+    """
+    Set colour limits with a single 'changed' notification. set_clim assigns norm.vmin and norm.vmax separately and
+    each fires the norm's callbacks, so an attached colorbar would otherwise redraw twice.
+    """
+    with mappable.norm.callbacks.blocked():
+        mappable.norm.vmin = float(vmin)
+        mappable.norm.vmax = float(vmax)
+    mappable.changed()
+
+
+_fft_spectrum_buffers = {}  # Zero-padded spectra reused across frames, keyed by output shape
+
+
+def fft_upsample(data_array: np.ndarray, dst: np.ndarray):
+    """
+    Upsample into dst by zero-padding the 2D spectrum. The sensor is band-limited, so this gives a smoother result
+    than bicubic at similar cost on a frame this small.
+    """
+    in_rows, in_cols = data_array.shape
+    out_shape = dst.shape
+    if out_shape not in _fft_spectrum_buffers:
+        _fft_spectrum_buffers[out_shape] = np.zeros((out_shape[0], out_shape[1] // 2 + 1), dtype=complex)
+    spectrum = _fft_spectrum_buffers[out_shape]
+
+    # The input's Nyquist row and column aren't Nyquist bins in the larger grid, so their energy is split evenly
+    # between the matching positive and negative frequencies (assumes even input dimensions, as on the sensor)
+    half_rows = in_rows // 2
+    half_cols = in_cols // 2
+    in_spectrum = np.fft.rfft2(data_array)
+    spectrum[:half_rows, : half_cols + 1] = in_spectrum[:half_rows]  # positive row frequencies
+    spectrum[-half_rows + 1 :, : half_cols + 1] = in_spectrum[-half_rows + 1 :]  # negative row frequencies
+    spectrum[half_rows, : half_cols + 1] = in_spectrum[half_rows] / 2  # Nyquist row, split across +/-
+    spectrum[-half_rows, : half_cols + 1] = in_spectrum[half_rows] / 2
+    spectrum[:, half_cols] /= 2  # Nyquist column; rfft's implied negative half supplies the other half
+    scale = (out_shape[0] * out_shape[1]) / (in_rows * in_cols)  # irfft2 normalizes by the larger size
+    np.multiply(np.fft.irfft2(spectrum, s=out_shape), scale, out=dst, casting="unsafe")
+
+
+if INTERPOLATION_METHOD == "fft":
+    # Zero-padded upsampling is exact interpolation, so the output must pass through the input samples
+    _check_frame = np.random.default_rng().normal(30, 5, (24, 32)).astype(np.float32)
+    _check_output = np.empty((240, 320), dtype=np.float32)
+    fft_upsample(_check_frame, _check_output)
+    assert np.allclose(_check_output[::10, ::10], _check_frame, atol=1e-3), "fft_upsample does not preserve samples"
+
+if INTERPOLATION_METHOD == "numba":
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def bilinear_upsample(src, dst):
+        """ Bilinear upsample of src into the preallocated dst by an integer factor """
+        in_rows, in_cols = src.shape
+        factor = dst.shape[0] // in_rows
+        step = 1.0 / factor
+        for i in prange(dst.shape[0]):
+            fy = min(max((i + 0.5) * step - 0.5, 0.0), in_rows - 1.0)  # sample at pixel centres, as cv2 and FFT do
+            y0 = int(fy)
+            y1 = min(y0 + 1, in_rows - 1)
+            wy = fy - y0
+            for j in range(dst.shape[1]):
+                fx = min(max((j + 0.5) * step - 0.5, 0.0), in_cols - 1.0)
+                x0 = int(fx)
+                x1 = min(x0 + 1, in_cols - 1)
+                wx = fx - x0
+                top = src[y0, x0] * (1.0 - wx) + src[y0, x1] * wx
+                bottom = src[y1, x0] * (1.0 - wx) + src[y1, x1] * wx
+                dst[i, j] = top * (1.0 - wy) + bottom * wy
+
+    # Compile on a dummy (flipped view) frame now so the first live frame isn't stalled by the JIT
+    bilinear_upsample(np.zeros((24, 32), dtype=np.float32)[:, ::-1], np.empty((240, 320), dtype=np.float32))
+
+
+def interpolate(data_array: np.ndarray, dst: np.ndarray):
+    """ Upsample a frame into the preallocated dst using the method set in INTERPOLATION_METHOD """
+    if INTERPOLATION_METHOD == "fft":
+        fft_upsample(data_array, dst)
+    elif INTERPOLATION_METHOD == "numba":
+        bilinear_upsample(data_array, dst)
+    else:
+        cv2.resize(
+            data_array, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_CUBIC
+        )  # cv2 takes (width, height)
+    return dst
+
+
+def apply_colormap(
+    data_array: np.ndarray,
+    vmin: float,
+    vmax: float,
+    lut: np.ndarray,
+    scaled: np.ndarray,
+    indices: np.ndarray,
+    dst: np.ndarray,
+):
+    """
+    Colour a frame via a 256 entry RGBA lookup table, writing into dst. Passing imshow pre-coloured uint8 data skips
+    its per-draw normalize and colormap step.
+    """
+    np.subtract(data_array, vmin, out=scaled)
+    np.multiply(scaled, 256.0 / max(vmax - vmin, 1e-6), out=scaled)  # 256 bins, as matplotlib Colormap
+    np.clip(scaled, 0, 255, out=scaled)  # vmax itself scales to 256, so clip it into the top bin
+    np.copyto(indices, scaled, casting="unsafe")  # truncate to LUT indices without allocating
+    np.take(lut, indices, axis=0, out=dst)
+    return dst
+
+
+mean_temp_frame = np.zeros((24 * 32,), dtype=np.float32)  # array for all 768 temperatures, reused across calls
+
+
 # print out the average temperature from the MLX90640
 def print_mean_temp():
     """
     Get mean temp of entire field of view. Return both temp C and temp F.
     """
-    frame = np.zeros((24 * 32,))  # setup array for storing all 768 temperatures
-    while True:
+    for _ in range(5):
         try:
-            mlx.getFrame(frame)  # read MLX temperatures into frame var
+            mlx.getFrame(mean_temp_frame)  # read MLX temperatures into frame var
             break
         except ValueError:
-            continue  # if error, just read again
+            time.sleep(0.005)  # if error, back off briefly and read again
+    else:
+        raise RuntimeError("Failed to read a frame from the MLX90640 after 5 attempts")
 
-    temp_c = np.mean(frame)
+    temp_c = mean_temp_frame.mean()
     temp_f = c_to_f(temp_c)
     print("Average MLX90640 Temperature: {0:2.1f}C ({1:2.1f}F)".format(temp_c, temp_f))
     return temp_c, temp_f
@@ -92,42 +210,60 @@ def simple_pic():
     cbar = fig.colorbar(therm1)  # setup colorbar for temps
     cbar.set_label(r"Temperature [$^{\circ}$C]", fontsize=14)  # colorbar label
 
-    frame = np.zeros((24 * 32,))  # setup array for storing all 768 temperatures
+    frame = np.zeros((24 * 32,), dtype=np.float32)  # setup array for storing all 768 temperatures
     mlx.getFrame(frame)  # read MLX temperatures into frame var
-    data_array = np.reshape(frame, mlx_shape)  # reshape to 24x32
-    therm1.set_data(np.fliplr(data_array))  # flip left to right
-    therm1.set_clim(vmin=np.min(data_array), vmax=np.max(data_array))  # set bounds
-    cbar.on_mappable_changed(therm1)  # update colorbar range
-    plt.pause(0.001)  # required
+    data_array = frame.reshape(mlx_shape)[:, ::-1]  # reshape to 24x32 and flip left to right, both as views
+    therm1.set_data(data_array)
+    update_clim(therm1, frame.min(), frame.max())  # set bounds, also updates colorbar
+    fig.show()  # show the figure
+    fig.canvas.draw()  # draw once rather than via plt.pause, which also sleeps
+    fig.canvas.flush_events()  # show the new image
     fig.savefig(output_folder + "simple_pic.png", dpi=300, facecolor="#FCFCFC", bbox_inches="tight")
 
 
 def simple_camera_read():
     """# -- Sampling with Simple Routine"""
+    colorbar_update_interval = 5  # Seconds
     mlx.refresh_rate = adafruit_mlx90640.RefreshRate.REFRESH_8_HZ  # set refresh rate
     mlx_shape = (24, 32)
 
     # setup the figure for plotting
     plt.ion()  # enables interactive plotting
     fig, ax = plt.subplots(figsize=(12, 7))
-    therm1 = ax.imshow(np.zeros(mlx_shape), vmin=0, vmax=60)  # start plot with zeros
+    therm1 = ax.imshow(
+        np.zeros(mlx_shape, dtype=np.float32), vmin=0, vmax=60, animated=True
+    )  # start plot with zeros, animated so it's only drawn by blitting
     cbar = fig.colorbar(therm1)  # setup colorbar for temps
     cbar.set_label(r"Temperature [$^{\circ}$C]", fontsize=14)  # colorbar label
 
-    frame = np.zeros((24 * 32,))  # setup array for storing all 768 temperatures
-    t_array = []
+    fig.canvas.draw()  # draw figure to copy background
+    ax_background = fig.canvas.copy_from_bbox(ax.bbox)  # copy background
+    fig.show()  # show the figure before blitting
+
+    frame = np.zeros((24 * 32,), dtype=np.float32)  # setup array for storing all 768 temperatures
+    t_array = deque(maxlen=10)  # start times of recently rendered frames for frame rate approx
+    last_update = -100
     while True:
         t1 = time.monotonic()
         try:
             mlx.getFrame(frame)  # read MLX temperatures into frame var
-            data_array = np.reshape(frame, mlx_shape)  # reshape to 24x32
-            therm1.set_data(np.fliplr(data_array))  # flip left to right
-            therm1.set_clim(vmin=np.min(data_array), vmax=np.max(data_array))  # set bounds
-            cbar.on_mappable_changed(therm1)  # update colorbar range
-            plt.pause(0.001)  # required
+            data_array = frame.reshape(mlx_shape)[:, ::-1]  # reshape to 24x32 and flip left to right, both as views
+            therm1.set_data(data_array)
+            full_update = t1 - last_update > colorbar_update_interval
+            if full_update:  # Colorbar changes invalidate the background
+                last_update = t1
+                update_clim(therm1, frame.min(), frame.max())  # set bounds, also updates colorbar
+                fig.canvas.draw()
+                ax_background = fig.canvas.copy_from_bbox(ax.bbox)
+
+            fig.canvas.restore_region(ax_background)  # restore background
+            ax.draw_artist(therm1)  # draw new thermal image
+            fig.canvas.blit(ax.bbox)  # draw background
+            fig.canvas.flush_events()  # show the new image
             # fig.savefig(output_folder + 'mlx90640_test_fliplr.png',dpi=300,facecolor='#FCFCFC', bbox_inches='tight') # comment out to speed up
-            t_array.append(time.monotonic() - t1)
-            print("Sample Rate: {0:2.1f}fps".format(len(t_array) / np.sum(t_array)))
+            t_array.append(t1)  # reuses the start time above rather than timing each frame again
+            if full_update and len(t_array) > 1:  # print with the colorbar updates rather than every frame
+                print("Sample Rate: {0:2.1f}fps".format((len(t_array) - 1) / (t_array[-1] - t_array[0])))
         except ValueError:
             continue  # if error, just read again
 
@@ -146,7 +282,7 @@ def interpolated_pic():
     ax = fig.add_subplot(111)  # add subplot
     fig.subplots_adjust(0.05, 0.05, 0.95, 0.95)  # get rid of unnecessary padding
     therm1 = ax.imshow(
-        np.zeros(mlx_interp_shape), interpolation="none", cmap=plt.cm.bwr, vmin=25, vmax=45
+        np.zeros(mlx_interp_shape, dtype=np.float32), interpolation="none", cmap=plt.cm.bwr, vmin=25, vmax=45
     )  # preemptive image
     cbar = fig.colorbar(therm1)  # setup colorbar
     cbar.set_label(r"Temperature [$^{\circ}$C]", fontsize=14)  # colorbar label
@@ -155,17 +291,16 @@ def interpolated_pic():
     ax_background = fig.canvas.copy_from_bbox(ax.bbox)  # copy background
     fig.show()  # show the figure before blitting
 
-    frame = np.zeros(mlx_shape[0] * mlx_shape[1])  # 768 pts
+    frame = np.zeros(mlx_shape[0] * mlx_shape[1], dtype=np.float32)  # 768 pts
+    data_array = np.empty(mlx_interp_shape, dtype=np.float32)  # interpolated frame, reused each update
 
     def plot_update():
         logger.debug("Updating plot")
         fig.canvas.restore_region(ax_background)  # restore background
         mlx.getFrame(frame)  # read mlx90640
-        data_array = np.fliplr(np.reshape(frame, mlx_shape))  # reshape, flip data
-        data_array = ndimage.zoom(data_array, mlx_interp_val)  # interpolate
+        interpolate(frame.reshape(mlx_shape)[:, ::-1], data_array)  # reshape and flip as a view, interpolate
         therm1.set_array(data_array)  # set data
-        therm1.set_clim(vmin=np.min(data_array), vmax=np.max(data_array))  # set bounds
-        cbar.on_mappable_changed(therm1)  # update colorbar range
+        update_clim(therm1, frame.min(), frame.max())  # set bounds from the raw 768 pts
 
         ax.draw_artist(therm1)  # draw new thermal image
         fig.canvas.blit(ax.bbox)  # draw background
@@ -187,40 +322,103 @@ def interpolated_camera_read():
 
     mlx_shape = (24, 32)
 
-    mlx_interp_val = 10  # interpolate # on each dimension
+    mlx_interp_val = 5  # interpolate # on each dimension; matplotlib scales the rest of the way to the axes size
     mlx_interp_shape = (mlx_shape[0] * mlx_interp_val, mlx_shape[1] * mlx_interp_val)  # new shape
 
     fig = plt.figure(figsize=(9, 5))  # start figure
     ax = fig.add_subplot(111)  # add subplot
     fig.subplots_adjust(0.05, 0.05, 0.95, 0.95)  # get rid of unnecessary padding
+    lut = plt.cm.bwr(np.linspace(0, 1, 256), bytes=True)  # uint8 RGBA colormap lookup table
+    image = np.zeros(mlx_interp_shape + (4,), dtype=np.uint8)  # coloured frame, reused each update
     therm1 = ax.imshow(
-        np.zeros(mlx_interp_shape), interpolation="none", cmap=plt.cm.bwr, vmin=25, vmax=45
-    )  # preemptive image
+        image,
+        interpolation="none",
+        cmap=plt.cm.bwr,
+        vmin=25,
+        vmax=45,
+        animated=True,
+    )  # preemptive image, animated so it's only drawn by blitting; cmap and limits still drive the colorbar
     cbar = fig.colorbar(therm1)  # setup colorbar
     cbar.set_label(r"Temperature [$^{\circ}$C]", fontsize=14)  # colorbar label
 
+    ax_background = None
+
+    def on_draw(event):  # pylint: disable=unused-argument
+        nonlocal ax_background
+        ax_background = fig.canvas.copy_from_bbox(ax.bbox)  # full draws invalidate the background, so recopy
+        ax.draw_artist(therm1)  # full draws skip the animated image, so put it back on top
+        fig.canvas.blit(ax.bbox)
+
+    fig.canvas.mpl_connect("draw_event", on_draw)
     fig.canvas.draw()  # draw figure to copy background
-    ax_background = fig.canvas.copy_from_bbox(ax.bbox)  # copy background
     fig.show()  # show the figure before blitting
 
-    frame = np.zeros(mlx_shape[0] * mlx_shape[1])  # 768 pts
+    frame = np.zeros(mlx_shape[0] * mlx_shape[1], dtype=np.float32)  # 768 pts
+    data_array = np.empty(mlx_interp_shape, dtype=np.float32)  # interpolated frame, reused each update
+    scaled = np.empty(mlx_interp_shape, dtype=np.float32)  # colormap scratch buffer
+    indices = np.empty(mlx_interp_shape, dtype=np.uint8)  # colormap lookup indices
+
+    # Read the sensor on a background thread so rendering overlaps the I2C transfer, which releases the GIL
+    shared_frame = np.zeros(mlx_shape[0] * mlx_shape[1], dtype=np.float32)  # latest complete frame
+    frame_lock = threading.Lock()
+    frame_ready = threading.Event()
+    read_error = None  # set by the reader thread if it stops, re-raised on the GUI thread
+
+    def read_frames():
+        nonlocal read_error
+        read_buffer = np.zeros(mlx_shape[0] * mlx_shape[1], dtype=np.float32)
+        get_frame = mlx.getFrame
+        while True:
+            try:
+                get_frame(read_buffer)  # read mlx90640
+            except ValueError:
+                continue  # if error, just read again
+            except Exception as e:  # pylint: disable=broad-except
+                read_error = e  # hand any other failure (e.g. too many retries, I2C OSError) to plot_update
+                frame_ready.set()
+                return
+            with frame_lock:  # set under the lock, as plot_update clears it, so a frame is never rendered twice
+                shared_frame[:] = read_buffer
+                frame_ready.set()
+
+    threading.Thread(target=read_frames, daemon=True).start()
+
+    # Bind per-frame lookups to locals once so the update loop avoids repeated attribute chains
+    flipped_frame = frame.reshape(mlx_shape)[:, ::-1]  # reshape and flip as a view, stays valid as frame is reused
+    wait_for_frame = frame_ready.wait
+    clear_frame_ready = frame_ready.clear
+    restore_region = fig.canvas.restore_region
+    blit = fig.canvas.blit
+    flush_events = fig.canvas.flush_events
+    draw_artist = ax.draw_artist
+    bbox = ax.bbox
+    set_data = therm1.set_data
+    get_clim = therm1.get_clim
 
     def plot_update(full_update: bool):
-        fig.canvas.restore_region(ax_background)  # restore background
-        mlx.getFrame(frame)  # read mlx90640
-        data_array = np.fliplr(np.reshape(frame, mlx_shape))  # reshape, flip data
-        data_array = ndimage.zoom(data_array, mlx_interp_val)  # interpolate
+        if not wait_for_frame(timeout=1.0):  # keep the GUI responsive if the sensor stalls
+            flush_events()
+            return False  # no new frame rendered
+        if read_error is not None:
+            raise read_error
+        with frame_lock:
+            frame[:] = shared_frame
+            clear_frame_ready()
+        interpolate(flipped_frame, data_array)  # interpolate
         if full_update:
-            therm1.set_array(data_array)  # set data
-            therm1.set_clim(vmin=np.min(data_array), vmax=np.max(data_array))  # set bounds
-            cbar.on_mappable_changed(therm1)  # update colorbar range
+            update_clim(therm1, frame.min(), frame.max())  # set bounds from the raw 768 pts
+        apply_colormap(data_array, *get_clim(), lut, scaled, indices, image)
+        set_data(image)  # set data
+        if full_update:
+            fig.canvas.draw_idle()  # redraw on the next event loop pass, coalesced with any resize redraws
 
-        ax.draw_artist(therm1)  # draw new thermal image
-        fig.canvas.blit(ax.bbox)  # draw background
-        fig.canvas.flush_events()  # show the new image
-        return
+        restore_region(ax_background)  # restore background
+        draw_artist(therm1)  # draw new thermal image
+        blit(bbox)  # draw background
+        flush_events()  # show the new image
+        return True
 
-    t_array = []
+    t_array = deque(maxlen=10)  # start times of recently rendered frames for frame rate approx
     last_update = -100
     count = 0
     while True:
@@ -231,15 +429,13 @@ def interpolated_camera_read():
             full_update = True
         else:
             full_update = False
-        plot_update(full_update)  # update plot
+        if plot_update(full_update):  # update plot
+            t_array.append(t1)  # reuses the start time above rather than timing each frame again
         # except:  # pylint: disable=E722
         #     continue
-        # approximating frame rate
-        t_array.append(time.monotonic() - t1)
-        if len(t_array) > 10:
-            t_array = t_array[1:]  # recent times for frame rate approx
         if full_update:
-            print("Frame Rate: {0:2.1f}fps".format(len(t_array) / np.sum(t_array)))
+            if len(t_array) > 1:
+                print("Frame Rate: {0:2.1f}fps".format((len(t_array) - 1) / (t_array[-1] - t_array[0])))
             count += 1
             if profiling & (count >= 20):
                 logger.info("Printing and dumping profiling stats")
@@ -15,7 +15,7 @@ setuptools.setup(
     packages=['pithermalcam'],
     install_requires=[
         'numpy>=1.16.5',
-        'matplotlib',
+        'matplotlib>=3.5',
         'scipy>=1.6.0',
         'RPI.GPIO',
         'Adafruit-Blinka',